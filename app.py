@@ -1,9 +1,20 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-from plotly.subplots import make_subplots
 import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import csv
+import hashlib
+import html
+import io
+import importlib.util
 from datetime import datetime, time
+from streamlit.runtime.uploaded_file_manager import UploadedFile
+from models import LoadedData
+
+# Datashader (ไม่บังคับ): ใช้ rasterize กราฟ Overlay ที่มีจุดจำนวนมาก
+# เช็คแค่ว่าติดตั้งไว้หรือไม่ ส่วนการ import จริงทำตอนใช้งาน (import ช้า)
+HAS_DATASHADER = importlib.util.find_spec('datashader') is not None
 
 # ---------------------------------------------------------
 # 1. ตั้งค่าหน้า Web App
@@ -14,124 +25,698 @@ st.title("Anode Current Monitor v.1.1 [Updated 24/12/25]")
 # ---------------------------------------------------------
 # 2. ฟังก์ชันโหลดและรวมข้อมูล 
 # ---------------------------------------------------------
-@st.cache_data
+# คอลัมน์ที่ไม่ใช่ค่ากระแส (อ่านเป็น string)
+TEXT_COLS = ('DATE', 'TIME')
+
+# New Fixed Bare Anode Columns (คำนวณเพิ่มใน load_and_combine_data)
+NEW_FIXED_COLS = [
+    'Bare Anode B7 (REC.1)', 
+    'Total Left Bare Anode (L6+B4)', 
+    'Total Right Bare Anode (R6+R8)', 
+    'Total Bottom Bare Anode (B2+B3+L8+L10+L12)', 
+    'Overall Bare Anode'
+]
+
+# คอลัมน์ที่ไม่ให้ผู้ใช้เลือกพลอต
+NON_SELECTABLE_COLS = frozenset(['DATE', 'TIME', 'Enable Alarm Rec.1', 'Enable Alarm Rec.2'])
+
+def hash_uploaded_file(file):
+    return hashlib.blake2b(file.getvalue(), digest_size=16).hexdigest()
+
+# Arrow string -> pandas Arrow string (ไม่แปลงเป็น object)
+ARROW_TYPES_MAPPER = {
+    pa.string(): pd.StringDtype('pyarrow'),
+    pa.large_string(): pd.StringDtype('pyarrow'),
+}.get
+
+def read_anode_table(file):
+    """อ่าน CSV หนึ่งไฟล์เป็น pyarrow.Table (ยังไม่แปลงเป็น pandas)"""
+    data = file.getvalue()
+    header_line = io.BytesIO(data).readline().decode('utf-8-sig')
+    columns = [c.strip() for c in next(csv.reader([header_line]))] # Clean column names
+
+    # ค่ากระแสและคอลัมน์ Alarm อ่านเป็น float32 โดยตรง (ระบุชนิดไว้ทุกคอลัมน์
+    # ไม่ต้องให้ Arrow เดา: Alarm ที่ว่างช่วงต้นไฟล์อาจถูกเดาเป็น null)
+    # DATE/TIME เป็น Arrow string (ใช้หน่วยความจำน้อยกว่า object มาก)
+    text_types = {c: pa.string() for c in columns if c in TEXT_COLS}
+    column_types = {c: pa.float32() for c in columns if c not in TEXT_COLS}
+    column_types.update(text_types)
+    read_options = pa_csv.ReadOptions(column_names=columns, skip_rows=1)
+
+    try:
+        return pa_csv.read_csv(
+            io.BytesIO(data), read_options=read_options,
+            convert_options=pa_csv.ConvertOptions(column_types=column_types)
+        )
+    except pa.ArrowInvalid:
+        # Fallback: ให้ Arrow เดาชนิดเอง (เช่น มีค่าที่ไม่ใช่ตัวเลขในคอลัมน์กระแส)
+        return pa_csv.read_csv(
+            io.BytesIO(data), read_options=read_options,
+            convert_options=pa_csv.ConvertOptions(column_types=text_types)
+        )
+
+# รวม schema ที่ต่างกันได้ (คอลัมน์ขาด/ชนิดตัวเลขต่างกัน); pyarrow < 14 ใช้ promote=True
+if int(pa.__version__.split('.')[0]) >= 14:
+    CONCAT_PROMOTE = {'promote_options': 'permissive'}
+else:
+    CONCAT_PROMOTE = {'promote': True}
+
+def combine_tables(tables):
+    """รวมหลายไฟล์ด้วย pa.concat_tables (ต่อ chunk ไม่ copy) แล้วแปลงเป็น pandas ครั้งเดียว"""
+    try:
+        combined = pa.concat_tables(tables, **CONCAT_PROMOTE)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # ชนิดคอลัมน์ต่างกันจนรวมใน Arrow ไม่ได้ (เช่น ไฟล์หนึ่งอ่านแบบ fallback)
+        return pd.concat(
+            [t.to_pandas(types_mapper=ARROW_TYPES_MAPPER) for t in tables],
+            ignore_index=True
+        )
+
+    # self_destruct + split_blocks: คืนหน่วยความจำ Arrow ระหว่างแปลง (peak ไม่เป็น 2 เท่า)
+    return combined.to_pandas(self_destruct=True, split_blocks=True, types_mapper=ARROW_TYPES_MAPPER)
+
+# persist="disk": ผลการอ่านไฟล์อยู่รอดข้ามการ restart app (key คือ hash ของเนื้อไฟล์)
+# max_entries=4: DataFrame แต่ละชุดใหญ่มาก เก็บในหน่วยความจำแค่ 4 ชุดล่าสุด (evict แบบ LRU)
+# หมายเหตุ: max_entries จำกัดเฉพาะในหน่วยความจำ ไฟล์ .memo ใน ~/.streamlit/cache ไม่ถูกลบเอง
+# (ไฟล์ละหนึ่งชุดไฟล์ที่อัปโหลด) ล้างได้ด้วยคำสั่ง `streamlit cache clear` หรือเมนู Clear cache
+# ไม่ใส่ ttl เพราะ Streamlit ไม่รองรับ ttl เมื่อ persist="disk" (จะถูกเมินพร้อม warning)
+LOAD_CACHE_MAX_ENTRIES = 4
+
+@st.cache_data(
+    persist="disk",
+    max_entries=LOAD_CACHE_MAX_ENTRIES,
+    show_spinner="Parsing CSVs…",
+    hash_funcs={UploadedFile: hash_uploaded_file}
+)
 def load_and_combine_data(uploaded_files):
-    all_dfs = []
+    digest = hashlib.blake2b(digest_size=16)
+    all_tables = []
     for file in uploaded_files:
+        digest.update(hash_uploaded_file(file).encode())
         try:
-            temp_df = pd.read_csv(file)
-            temp_df.columns = temp_df.columns.str.strip() # Clean column names
-            all_dfs.append(temp_df)
+            all_tables.append(read_anode_table(file))
         except Exception as e:
             st.error(f"Error reading file {file.name}: {e}")
             
-    if not all_dfs:
+    if not all_tables:
         return None
 
-    combined_df = pd.concat(all_dfs, ignore_index=True)
+    combined_df = combine_tables(all_tables)
     
-    # รวม Date+Time -> Timestamp
-    combined_df['Timestamp'] = pd.to_datetime(
-        combined_df['DATE'] + ' ' + combined_df['TIME'], 
-        format='%d/%m/%Y %H:%M:%S', 
-        dayfirst=True,
-        errors='coerce' 
-    )
+    # รวม Date+Time -> Timestamp (แปลงแยกกันแล้วบวก แทนการต่อ string ทีละแถว)
+    # cache=True: วันที่ซ้ำกันมาก (มีแค่ไม่กี่ค่าต่อไฟล์)
+    date_part = pd.to_datetime(combined_df['DATE'], format='%d/%m/%Y', errors='coerce', cache=True)
+    # เวลาก็ซ้ำกันทุกวัน: แปลงเฉพาะค่าที่ไม่ซ้ำแล้วกระจายกลับ (code -1 = ค่าว่าง -> NaT ตัวสุดท้าย)
+    time_codes, time_uniques = pd.factorize(combined_df['TIME'])
+    parsed_times = pd.to_timedelta(time_uniques, errors='coerce').to_numpy()
+    time_part = np.append(parsed_times, np.timedelta64('NaT', 'ns'))[time_codes]
+    combined_df['Timestamp'] = date_part + time_part
+    # DATE/TIME ไม่ได้ใช้ต่อแล้ว: ลบทิ้งก่อน dropna/sort จะได้ไม่ต้องย้ายข้อมูล string ไปด้วย
+    combined_df.drop(columns=[c for c in TEXT_COLS if c in combined_df.columns], inplace=True)
     
     combined_df.dropna(subset=['Timestamp'], inplace=True)
-    combined_df.sort_values(by='Timestamp', inplace=True)
+    # ไฟล์ส่วนใหญ่เรียงเวลามาแล้ว: เช็ค O(N) ก่อน แล้วค่อย sort เมื่อจำเป็น
+    # (mergesort ของ NumPy ใช้ประโยชน์จากช่วงที่เรียงอยู่แล้วของแต่ละไฟล์)
+    if not combined_df['Timestamp'].is_monotonic_increasing:
+        combined_df.sort_values(by='Timestamp', inplace=True, kind='mergesort')
     
     # -----------------------------------------------------------
     # ลดขนาดข้อมูล
     # -----------------------------------------------------------
-    numeric_cols = combined_df.select_dtypes(include=['float64']).columns
-    combined_df[numeric_cols] = combined_df[numeric_cols].astype('float32')
+    # ค่ากระแสทุกคอลัมน์เป็น float32 (รวมถึงไฟล์ที่อ่านผ่าน C engine ซึ่งอาจได้ int/object)
+    sensor_cols = [
+        col for col in combined_df.columns
+        if col not in TEXT_COLS and col != 'Timestamp' and not col.startswith('Enable Alarm')
+    ]
+    for col in sensor_cols:
+        if combined_df[col].dtype == np.float32:
+            continue
+        values = pd.to_numeric(combined_df[col], errors='coerce')
+        if values.notna().any(): # คอลัมน์ข้อความล้วนปล่อยไว้ตามเดิม
+            combined_df[col] = values.astype(np.float32)
     # -----------------------------------------------------------
     
     # --- เริ่มต้น: การคำนวณคอลัมน์ใหม่ ---
-    
+
+    # ดึงคอลัมน์ Bare Anode ทั้งหมดเป็น matrix float32 ครั้งเดียว แล้วรวมแต่ละกลุ่มด้วย NumPy
+    overall_bare_anode_cols = ['B7', 'L6', 'B4', 'R6', 'R8', 'B2', 'B3', 'L8', 'L10', 'L12']
+    existing_overall_cols = [col for col in overall_bare_anode_cols if col in combined_df.columns]
+    bare_mat = combined_df[existing_overall_cols].to_numpy(dtype=np.float32, copy=False)
+    bare_idx = {col: i for i, col in enumerate(existing_overall_cols)}
+
     # 1. Bare Anode B7 (REC.1) - ใช้ค่า B7 โดยตรง
-    if 'B7' in combined_df.columns:
-        combined_df['Bare Anode B7 (REC.1)'] = combined_df['B7']
+    if 'B7' in bare_idx:
+        combined_df['Bare Anode B7 (REC.1)'] = bare_mat[:, bare_idx['B7']]
     else:
-        combined_df['Bare Anode B7 (REC.1)'] = 0
+        combined_df['Bare Anode B7 (REC.1)'] = np.float32(0)
 
     # 2. Total Left Bare Anode (L6+B4)
-    if 'L6' in combined_df.columns and 'B4' in combined_df.columns:
-        combined_df['Total Left Bare Anode (L6+B4)'] = combined_df['L6'] + combined_df['B4']
+    if 'L6' in bare_idx and 'B4' in bare_idx:
+        combined_df['Total Left Bare Anode (L6+B4)'] = bare_mat[:, [bare_idx['L6'], bare_idx['B4']]].sum(axis=1)
     else:
-        combined_df['Total Left Bare Anode (L6+B4)'] = 0
+        combined_df['Total Left Bare Anode (L6+B4)'] = np.float32(0)
 
     # 3. Total Right Bare Anode (R6+R8)
-    if 'R6' in combined_df.columns and 'R8' in combined_df.columns:
-        combined_df['Total Right Bare Anode (R6+R8)'] = combined_df['R6'] + combined_df['R8']
+    if 'R6' in bare_idx and 'R8' in bare_idx:
+        combined_df['Total Right Bare Anode (R6+R8)'] = bare_mat[:, [bare_idx['R6'], bare_idx['R8']]].sum(axis=1)
     else:
-        combined_df['Total Right Bare Anode (R6+R8)'] = 0
+        combined_df['Total Right Bare Anode (R6+R8)'] = np.float32(0)
 
     # 4. Total Bottom Bare Anode (B2+B3+L8+L10+L12)
     bottom_cols = ['B2', 'B3', 'L8', 'L10', 'L12']
-    existing_bottom_cols = [col for col in bottom_cols if col in combined_df.columns]
-    if existing_bottom_cols:
-        combined_df['Total Bottom Bare Anode (B2+B3+L8+L10+L12)'] = combined_df[existing_bottom_cols].sum(axis=1)
+    existing_bottom_idx = [bare_idx[col] for col in bottom_cols if col in bare_idx]
+    if existing_bottom_idx:
+        combined_df['Total Bottom Bare Anode (B2+B3+L8+L10+L12)'] = np.nansum(bare_mat[:, existing_bottom_idx], axis=1)
     else:
-        combined_df['Total Bottom Bare Anode (B2+B3+L8+L10+L12)'] = 0
+        combined_df['Total Bottom Bare Anode (B2+B3+L8+L10+L12)'] = np.float32(0)
 
     # 5. Overall Bare Anode (รวมทุกตัวที่ใช้คำนวณ Bare Anode)
-    overall_bare_anode_cols = ['B7', 'L6', 'B4', 'R6', 'R8', 'B2', 'B3', 'L8', 'L10', 'L12']
-    existing_overall_cols = [col for col in overall_bare_anode_cols if col in combined_df.columns]
     if existing_overall_cols:
-        combined_df['Overall Bare Anode'] = combined_df[existing_overall_cols].sum(axis=1)
+        combined_df['Overall Bare Anode'] = np.nansum(bare_mat, axis=1)
     else:
-        combined_df['Overall Bare Anode'] = 0
+        combined_df['Overall Bare Anode'] = np.float32(0)
 
     # --- สิ้นสุด: การคำนวณคอลัมน์ใหม่ ---
 
     combined_df.set_index('Timestamp', inplace=True)
-    
-    return combined_df
+
+    # --- กำหนดกลุ่มคอลัมน์คงที่ (Fixed Total Columns) ---
+    all_numeric_cols = combined_df.select_dtypes(include=['float', 'int']).columns.tolist()
+    numeric_set = frozenset(all_numeric_cols)
+
+    # Original Fixed Total Columns (Total REC, Total Left/Bottom/Right)
+    original_fixed_cols = [col for col in all_numeric_cols if 'Total' in col and 'Bare Anode' not in col]
+
+    # รวมคอลัมน์ Fixed ทั้งหมด
+    fixed_total_cols = [col for col in original_fixed_cols + NEW_FIXED_COLS if col in numeric_set]
+
+    # คอลัมน์ที่ผู้ใช้เลือกได้ (คือทุกคอลัมน์ที่ไม่ใช่คอลัมน์ Total/Bare Anode Total)
+    excluded_cols = frozenset(fixed_total_cols) | NON_SELECTABLE_COLS
+    selectable_cols = [col for col in all_numeric_cols if col not in excluded_cols]
+
+    return LoadedData(
+        df=combined_df,
+        numeric_cols=all_numeric_cols,
+        fixed_total_cols=fixed_total_cols,
+        selectable_cols=selectable_cols,
+        new_fixed_cols=[col for col in NEW_FIXED_COLS if col in numeric_set],
+        digest=digest.hexdigest(),
+    )
+
+def column_matrix(df, cols):
+    """คอลัมน์ที่เลือกเป็น float32 (N x C) C-contiguous ด้วยการ copy ครั้งเดียว
+
+    (df[cols].to_numpy() ได้ F-order จึงต้อง copy ซ้ำก่อนส่งเข้า kernel)
+    """
+    out = np.empty((len(df), len(cols)), dtype=np.float32)
+    for j, col in enumerate(cols):
+        out[:, j] = df[col].to_numpy()
+    return out
 
 # ฟังก์ชันคำนวณพื้นที่ใต้กราฟ
-def calculate_auc(df, col_name):
-    y = df[col_name].values
-    x_seconds = (df.index - df.index[0]).total_seconds()
-    
-    # --- แก้ไข(Support NumPy 2.0+) ---
-    if hasattr(np, 'trapezoid'):
-        area_coulombs = np.trapezoid(y, x_seconds)
+def calculate_auc_matrix(df, cols):
+    """คำนวณ Charge/Avg/Min/Max ของทุกคอลัมน์ใน cols พร้อมกันในรอบเดียว"""
+    # import kernels เฉพาะตอนใช้ (import numba + warmup JIT ช้า หน้าแรกจะได้เปิดเร็ว)
+    from kernels import minmax_cols, trapezoid_cols, trapezoid_uniform_cols
+
+    index_values = df.index.values
+    y = column_matrix(df, cols)
+
+    # ข้อมูลที่ห่างเท่ากันทุกจุด (เช่น 5s ต่อเนื่อง) ใช้สูตรปิดได้เลย ไม่ต้องสร้างแกน x
+    step = index_values[1] - index_values[0] if len(index_values) > 1 else None
+    if step is not None and step > np.timedelta64(0) and np.all(np.diff(index_values) == step):
+        dt_seconds = step / np.timedelta64(1, 's')
+        area_coulombs = trapezoid_uniform_cols(y, dt_seconds)
+        duration_seconds = dt_seconds * (len(index_values) - 1)
     else:
-        area_coulombs = np.trapz(y, x_seconds)
-    # -------------------------------------
+        x_seconds = np.ascontiguousarray((index_values - index_values[0]) / np.timedelta64(1, 's'), dtype=np.float64)
+        area_coulombs = trapezoid_cols(y, x_seconds)
+        duration_seconds = x_seconds[-1] if len(x_seconds) > 0 else 0
 
     area_amp_hours = area_coulombs / 3600
-    
+    min_vals, max_vals = minmax_cols(y)
+
     # คำนวณค่าเฉลี่ย
-    duration_seconds = x_seconds[-1] if len(x_seconds) > 0 else 0
-    avg_current = area_coulombs / duration_seconds if duration_seconds > 0 else 0
-    
-    return area_coulombs, area_amp_hours, avg_current
+    avg_current = area_coulombs / duration_seconds if duration_seconds > 0 else np.zeros(len(cols))
+
+    return pd.DataFrame({
+        'Total Charge (Ah)': area_amp_hours,
+        'Total Charge (C)': area_coulombs,
+        'Avg Current (A)': avg_current,
+        'Min Current (A)': min_vals,
+        'Max Current (A)': max_vals,
+    }, index=pd.Index(cols, name='Parameter'))
+
+def window_plot_frame(df, start_date, end_date, rule, cols):
+    """กรองช่วงเวลา + Resample + AUC -> (plot_df, auc_df) หรือ (None, None) ถ้าไม่มีข้อมูล"""
+    # index เรียงเวลาแล้ว: หาขอบด้วย binary search แล้ว slice (ไม่ต้องสร้าง mask ยาว N)
+    lo = df.index.searchsorted(start_date, side='left')
+    hi = df.index.searchsorted(end_date, side='right')
+    if hi <= lo:
+        return None, None
+
+    filtered_raw_df = df.iloc[lo:hi]
+    cols = list(cols)
+
+    # รวมคอลัมน์ที่ใช้เป็น block float32 เดียว (ข้อมูลจาก Arrow แยก block ทีละคอลัมน์)
+    # groupby/mean จะคำนวณทุกคอลัมน์ในรอบเดียวแทนการวนทีละ block
+    matrix_df = pd.DataFrame(
+        column_matrix(filtered_raw_df, cols),
+        index=filtered_raw_df.index, columns=cols, copy=False
+    )
+
+    if rule:
+        plot_df = matrix_df.groupby(pd.Grouper(freq=rule)).mean()
+    else:
+        plot_df = matrix_df
+
+    # AUC คำนวณจากข้อมูลดิบ (ไม่ใช่ค่าเฉลี่ยหลัง resample)
+    auc_df = calculate_auc_matrix(matrix_df, cols)
+    return plot_df, auc_df
+
+# Timeframe ที่ได้ข้อมูลละเอียดเท่าหรือมากกว่าข้อมูลดิบ: ไม่ cache (สำเนาเต็มความละเอียดใหญ่เกินไป)
+FULL_RES_RULES = frozenset([None, "1S"])
+
+# cache เฉพาะผลหลัง resample (เล็ก) key คือ hash ของไฟล์ + ช่วงเวลา + rule + คอลัมน์
+# (_df ขึ้นต้นด้วย _ : Streamlit ไม่ hash DataFrame ทั้งก้อน)
+@st.cache_data(max_entries=32, ttl="30m")
+def resampled_plot_frame(data_digest, _df, start_date, end_date, rule, cols):
+    return window_plot_frame(_df, start_date, end_date, rule, cols)
+
+def compute_plot_frame(data, start_date, end_date, rule, cols):
+    """คืนค่า (plot_df, auc_df) ของข้อมูลที่โหลดแล้ว (LoadedData)"""
+    if rule in FULL_RES_RULES:
+        return window_plot_frame(data.df, start_date, end_date, rule, cols)
+    return resampled_plot_frame(data.digest, data.df, start_date, end_date, rule, cols)
+
+# รูปแบบตัวเลขของตาราง Summary
+SUMMARY_FORMATS = {
+    'Total Charge (Ah)': '{:,.2f}',
+    'Total Charge (C)': '{:,.0f}',
+    'Avg Current (A)': '{:,.2f}',
+    'Min Current (A)': '{:,.0f}',
+    'Max Current (A)': '{:,.0f}',
+}
+
+# สไตล์ของ Module Summary (เลียนแบบ st.metric)
+MODULE_SUMMARY_CSS = """
+<style>
+.module-grid { display: grid; gap: 1rem; }
+.module-name { font-weight: 700; margin-bottom: 0.5rem; }
+.module-label { font-size: 0.875rem; opacity: 0.7; margin-top: 0.75rem; }
+.module-value { font-size: 1.75rem; line-height: 1.2; }
+.module-delta { font-size: 0.875rem; opacity: 0.7; }
+</style>
+"""
+
+# --- ฟังก์ชันลดจำนวนจุดก่อนพลอต (LTTB) ---
+# จำนวนจุดต่อเส้นหลังลดขนาด (ยกเว้น Timeframe "1s (Special)")
+LTTB_TARGET_POINTS = 3000
+
+def plot_series(plot_df, cols, n_out):
+    """คืนค่า {col: (x, y)} สำหรับพลอต
+
+    ดึงข้อมูลเป็น NumPy ครั้งเดียว แล้วลดจำนวนจุดด้วย LTTB ทุกคอลัมน์พร้อมกัน
+    (n_out=None คือไม่ลดจำนวนจุด)
+    """
+    # แปลงแกนเวลาครั้งเดียวเป็น datetime64[ms] (ความละเอียดพอสำหรับข้อมูลรายวินาที)
+    # ทุกเส้นที่ไม่ถูกลดจุดใช้ array เดียวกัน และ string วันที่ใน JSON สั้นกว่าหน่วย ns/us
+    x = plot_df.index.to_numpy().astype('datetime64[ms]', copy=False)
+    y = column_matrix(plot_df, cols)
+
+    if n_out is None or n_out < 3 or len(x) <= n_out:
+        return {c: (x, y[:, j]) for j, c in enumerate(cols)}
+
+    from kernels import lttb_cols
+
+    xf = (x - x[0]).astype(np.int64).astype(np.float64)
+    idx = lttb_cols(xf, y, n_out)
+    return {c: (x[idx[j]], y[idx[j], j]) for j, c in enumerate(cols)}
+
+# cache เฉพาะผล LTTB (เล็ก): สลับ View Mode / Chart Type ไม่ต้องคำนวณใหม่ key คือ plot_key: (hash ไฟล์, ช่วงเวลา, rule, คอลัมน์)
+# ที่ระบุ plot_df ได้ครบ จึงไม่ต้อง hash _plot_df (ห้ามแก้ไขผลลัพธ์ เพราะแชร์ผ่าน cache)
+@st.cache_resource(max_entries=16)
+def downsampled_plot_series(plot_key, _plot_df, cols, n_out):
+    return plot_series(_plot_df, cols, n_out)
+
+def get_plot_series(plot_key, plot_df, cols, n_out):
+    """เหมือน plot_series แต่ cache ผลที่ลดจุดแล้ว
+
+    n_out=None (ความละเอียดเต็ม) ไม่ cache: สำเนา float32 ทั้งช่วงใหญ่เกินไป
+    """
+    if n_out is None:
+        return plot_series(plot_df, cols, n_out)
+    return downsampled_plot_series(plot_key, plot_df, cols, n_out)
+
+# --- ลดจุดแบบ Min/Max ต่อช่วง (เก็บ spike ไว้ครบ) ---
+# จำนวนจุดสูงสุดต่อ Trace ที่ create_trace ยอมส่งให้ Plotly (~2 จุด/ช่วง)
+MINMAX_TARGET_POINTS = 4000
+
+def _first_index_per_bin(mask, bin_id, starts):
+    # index แรกของแต่ละช่วงที่ mask เป็น True (ช่วงที่ไม่มีเลยใช้จุดแรกของช่วง)
+    hits = np.flatnonzero(mask)
+    bins, first = np.unique(bin_id[hits], return_index=True)
+    out = starts.copy()
+    out[bins] = hits[first]
+    return out
+
+def decimate_minmax(x, y, target=MINMAX_TARGET_POINTS):
+    """เก็บจุดต่ำสุดและสูงสุดของแต่ละช่วง (target/2 ช่วงเท่าๆ กัน)"""
+    n = len(y)
+    n_bins = target // 2
+    if n <= target or n_bins < 1:
+        return x, y
+
+    starts = np.linspace(0, n, n_bins + 1).astype(np.int64)[:-1]
+    counts = np.diff(np.append(starts, n))
+    bin_id = np.repeat(np.arange(n_bins), counts)
+
+    # fmin/fmax ข้าม NaN; ช่วงที่เป็น NaN ทั้งหมดจะไม่มีจุดที่ตรงกัน
+    yf = np.asarray(y, dtype=np.float64)
+    bin_min = np.fmin.reduceat(yf, starts)
+    bin_max = np.fmax.reduceat(yf, starts)
+    i_min = _first_index_per_bin(yf == bin_min[bin_id], bin_id, starts)
+    i_max = _first_index_per_bin(yf == bin_max[bin_id], bin_id, starts)
+
+    idx = np.unique(np.concatenate((i_min, i_max))) # เรียงตามเวลา
+    return x[idx], y[idx]
 
 # --- ฟังก์ชันช่วยสร้าง Trace ตามประเภทกราฟ ---
-def create_trace(x_data, y_data, name, chart_type, fixed_size=None):
+# จำนวนจุดที่เกินค่านี้จะใช้ WebGL (Scattergl) แทน SVG
+# (เส้นสั้นๆ SVG เร็วกว่าและไม่กิน WebGL context ของ browser)
+USE_GL_THRESHOLD = 20_000
+
+# จำนวนจุดรวมสูงสุดของทุกเส้นในโหมด Stacked (แบ่งเท่าๆ กันต่อ subplot)
+STACKED_POINT_BUDGET = 50_000
+
+# แสดง rangeslider ในโหมด Overlay เฉพาะเมื่อแต่ละเส้นมีจุดน้อยกว่านี้
+RANGESLIDER_MAX_POINTS = 20_000
+
+def x_axis_kwargs(x_data):
+    """แกนเวลาที่ห่างเท่ากันส่งเป็น x0/dx (ms) แทน array ทั้งเส้น
+
+    Plotly เขียน x ของทุก Trace ลง JSON แยกกัน (แม้จะเป็น array เดียวกัน)
+    ข้อมูลหลัง resample / ไม่ลดจุด จึงไม่ต้องส่งแกนเวลาซ้ำทุกเส้น
+    """
+    x = np.asarray(x_data)
+    if x.dtype.kind == 'M' and len(x) > 2:
+        steps = np.diff(x.astype('datetime64[ms]').astype(np.int64))
+        if steps[0] > 0 and (steps == steps[0]).all():
+            return dict(x0=pd.Timestamp(x[0]), dx=int(steps[0]))
+    return dict(x=x_data)
+
+def create_trace(x_data, y_data, name, chart_type, fixed_size=None, max_points=MINMAX_TARGET_POINTS):
+    """คืนค่า Trace เป็น dict ธรรมดา (ไม่สร้าง go.Scatter ทีละเส้น)
+
+    Plotly ตรวจสอบ property ครั้งเดียวตอน add_traces ทั้งชุด และ dict เดียวกัน
+    ใช้ซ้ำได้หลาย subplot โดยไม่ต้อง copy
+    """
+    # ข้อมูลที่ยังไม่ถูกลดจุด: เก็บ Min/Max ต่อช่วงก่อนส่งให้ Plotly (max_points=None = ไม่ลด)
+    if max_points is not None and len(x_data) > max_points:
+        x_data, y_data = decimate_minmax(np.asarray(x_data), np.asarray(y_data), max_points)
+
+    # ndarray float32 ต่อเนื่อง: Plotly 6 ส่งเป็น typed array (base64) แทน JSON list ของตัวเลข
+    y_data = np.ascontiguousarray(y_data, dtype=np.float32)
+    xs = x_axis_kwargs(x_data)
+
     common_hover = '%{y:.2f} A'
+    scatter_type = 'scattergl' if len(y_data) > USE_GL_THRESHOLD else 'scatter'
     
     if chart_type == "Line + Markers (เส้น+จุด)":
-        marker_size = fixed_size if fixed_size is not None else (2 if len(x_data) > 100000 else 6)
-        return go.Scatter(x=x_data, y=y_data, mode='lines+markers', marker=dict(size=marker_size), name=name, hovertemplate=common_hover)
+        marker_size = fixed_size if fixed_size is not None else (2 if len(y_data) > 100000 else 6)
+        return dict(type=scatter_type, **xs, y=y_data, mode='lines+markers', marker=dict(size=marker_size), name=name, hovertemplate=common_hover)
     
     elif chart_type == "Line (เส้นปกติ)":
-        return go.Scatter(x=x_data, y=y_data, mode='lines', name=name, hovertemplate=common_hover)
+        return dict(type=scatter_type, **xs, y=y_data, mode='lines', name=name, hovertemplate=common_hover)
     
     elif chart_type == "Bar (แท่ง)":
-        return go.Bar(x=x_data, y=y_data, name=name, hovertemplate=common_hover)
+        return dict(type='bar', **xs, y=y_data, name=name, hovertemplate=common_hover)
     
     elif chart_type == "Area (พื้นที่)":
-        return go.Scatter(x=x_data, y=y_data, mode='lines', fill='tozeroy', name=name, hovertemplate=common_hover)
+        return dict(type=scatter_type, **xs, y=y_data, mode='lines', fill='tozeroy', name=name, hovertemplate=common_hover)
     
     elif chart_type == "Scatter (จุดกระจาย)":
-        return go.Scatter(x=x_data, y=y_data, mode='markers', marker=dict(size=3), name=name, hovertemplate=common_hover)
+        return dict(type=scatter_type, **xs, y=y_data, mode='markers', marker=dict(size=3), name=name, hovertemplate=common_hover)
     
     else: # Default fallback
-        return go.Scatter(x=x_data, y=y_data, mode='lines', name=name)
+        return dict(type=scatter_type, **xs, y=y_data, mode='lines', name=name)
+
+# --- Rasterize กราฟ Overlay ขนาดใหญ่ฝั่ง server (Datashader) ---
+# จำนวนจุดรวม (แถว x คอลัมน์) ที่เกินค่านี้จะวาดเป็นรูปแทนการส่งทุกจุดให้ Plotly
+RASTER_POINT_THRESHOLD = 2_000_000
+RASTER_WIDTH, RASTER_HEIGHT = 1400, 450
+
+# สีของแต่ละเส้น (เท่ากับ colorway เริ่มต้นของ Plotly) ใช้ทั้งในภาพ raster และ legend
+TRACE_COLORS = [
+    '#636EFA', '#EF553B', '#00CC96', '#AB63FA', '#FFA15A',
+    '#19D3F3', '#FF6692', '#B6E880', '#FF97FF', '#FECB52',
+]
+
+def trace_color(i):
+    return TRACE_COLORS[i % len(TRACE_COLORS)]
+
+# Chart Type ที่วาดเป็น raster ได้ -> ชั้นที่วาด (Bar/Area ใช้ Trace ปกติเสมอ)
+RASTER_CHART_LAYERS = {
+    "Line (เส้นปกติ)": ('line',),
+    "Line + Markers (เส้น+จุด)": ('line', 'points'),
+    "Scatter (จุดกระจาย)": ('points',),
+}
+
+def add_raster_background(fig, plot_df, cols, chart_type):
+    """วาดทุกเส้นเป็นรูป PNG (สีตาม trace_color ของแต่ละคอลัมน์) แล้ววางเป็นพื้นหลังของแกน x/y"""
+    import datashader as ds
+    import datashader.transfer_functions as tf
+
+    x = plot_df.index.to_numpy()
+    t_ms = (x - x[0]) / np.timedelta64(1, 'ms')
+    values = column_matrix(plot_df, cols)
+
+    y_min = float(np.nanmin(values))
+    y_max = float(np.nanmax(values))
+    if y_max <= y_min:
+        y_max = y_min + 1.0
+
+    canvas = ds.Canvas(
+        plot_width=RASTER_WIDTH, plot_height=RASTER_HEIGHT,
+        x_range=(0.0, float(t_ms[-1])), y_range=(y_min, y_max)
+    )
+    # rasterize ทีละคอลัมน์ แล้วลงสีของคอลัมน์นั้น (สีเดียว ความเข้มตามจำนวนเส้นที่ทับกัน)
+    # ตัด NaN ออกก่อน: "1s (Special)" บนข้อมูล 5s มี NaN 4 ใน 5 แถว ถ้าไม่ตัดจะไม่มีเส้นให้วาดเลย
+    # ซ้อนทุกชั้นเป็นภาพเดียว (คอลัมน์หลังวาดทับคอลัมน์ก่อน)
+    chart_layers = RASTER_CHART_LAYERS[chart_type]
+    layers = []
+    for i, col in enumerate(cols):
+        valid = ~np.isnan(values[:, i])
+        if not valid.any():
+            continue
+        source = pd.DataFrame({'t_ms': t_ms[valid], 'y': values[valid, i]})
+        cmap = [trace_color(i)]
+        if 'line' in chart_layers:
+            layers.append(tf.shade(canvas.line(source, x='t_ms', y='y', agg=ds.count()), cmap=cmap, how='eq_hist'))
+        if 'points' in chart_layers:
+            points = tf.shade(canvas.points(source, x='t_ms', y='y', agg=ds.count()), cmap=cmap, how='eq_hist')
+            layers.append(tf.spread(points, px=1))
+    image = tf.stack(*layers).to_pil()
+
+    # แกนวันที่ของ Plotly ใช้หน่วย millisecond สำหรับ sizex
+    fig.add_layout_image(
+        source=image, xref='x', yref='y',
+        x=pd.Timestamp(x[0]), y=y_max,
+        sizex=float(t_ms[-1]), sizey=y_max - y_min,
+        sizing='stretch', layer='below'
+    )
+    fig.update_yaxes(range=[y_min, y_max])
+
+# --- การตั้งค่า Hover ---
+# ข้อมูลยาวกว่านี้ใช้ hover "x" แทน "x unified" (ไม่ต้องรวมค่าจากทุกเส้นทุกครั้งที่เลื่อนเมาส์)
+UNIFIED_HOVER_MAX_ROWS = 100_000
+# ค้นหาจุดสำหรับ hover/spike เฉพาะในรัศมีนี้ (pixel)
+HOVER_DISTANCE_PX = 20
+
+def hover_layout(plot_df):
+    """ค่า layout ของ hover ตามขนาดข้อมูล"""
+    return dict(
+        hovermode="x unified" if len(plot_df) <= UNIFIED_HOVER_MAX_ROWS else "x",
+        hoverdistance=HOVER_DISTANCE_PX,
+        spikedistance=HOVER_DISTANCE_PX,
+    )
+
+# ---------------------------------------------------------
+# ฟังก์ชันสร้างกราฟ
+# ---------------------------------------------------------
+def make_total_figure(plot_key, plot_df, fixed_groups, x_axis_format, lttb_points):
+    # import plotly เฉพาะตอนสร้างกราฟ (หน้าแรกที่ยังไม่อัปโหลดไฟล์จะเปิดเร็วขึ้น)
+    from plotly.subplots import make_subplots
+
+    # "1s (Special)" (lttb_points=None) ต้องการความละเอียดเต็ม จึงไม่จำกัดจุดใน create_trace
+    trace_cap = MINMAX_TARGET_POINTS if lttb_points else None
+
+    # --- 2. สร้าง Subplots ---
+    num_total_groups = len(fixed_groups)
+    subplot_titles = [title for title, _ in fixed_groups]
+
+    fig_total = make_subplots(
+        rows=num_total_groups, cols=1, 
+        shared_xaxes=True, 
+        vertical_spacing=0.05,
+        subplot_titles=subplot_titles
+    )
+
+    # --- 3. เพิ่ม Trace ในแต่ละกลุ่ม (Always Overlay) ---
+    # สร้าง Trace ครั้งเดียวต่อคอลัมน์ (คอลัมน์ที่อยู่หลายกลุ่มใช้ Trace เดิม)
+    needed_cols = list(dict.fromkeys(col for _, group_cols in fixed_groups for col in group_cols))
+    series = get_plot_series(plot_key, plot_df, tuple(sorted(needed_cols)), lttb_points)
+    total_chart_type = "Line (เส้นปกติ)" 
+    traces_by_col = {
+        col: create_trace(*series[col], col, total_chart_type, fixed_size=None, max_points=trace_cap)
+        for col in needed_cols
+    }
+
+    # เพิ่มทุก Trace ในคำสั่งเดียว (add_trace ทีละเส้นจะประมวลผล data ทั้งหมดซ้ำทุกครั้ง)
+    traces, rows = [], []
+    for i, (group_title, group_cols) in enumerate(fixed_groups):
+        for col in group_cols:
+            traces.append(traces_by_col[col])
+            rows.append(i + 1)
+    fig_total.add_traces(traces, rows=rows, cols=[1] * len(traces))
+
+    fig_total.update_yaxes(title_text="Current (Ampere)")
+
+    # --- 4. การตั้งค่า Layout และแกน X ---
+
+    fig_total.update_xaxes(
+        showticklabels=True,  
+        ticks='outside',
+        tickangle=45,          
+        **x_axis_format,       
+        row = list(range(1, num_total_groups + 1)), 
+        col = 1
+    )
+
+    total_height_fixed = 300 * num_total_groups 
+
+    fig_total.update_layout(
+        height=total_height_fixed,
+        **hover_layout(plot_df),
+        xaxis=dict(
+            rangeslider=dict(visible=False), 
+            type="date",
+            **x_axis_format
+        ),
+        showlegend=True, 
+        title=""
+    )
+
+    return fig_total
+
+def make_main_figure(plot_key, plot_df, cols, view_mode, chart_type, x_axis_format, lttb_points):
+    import plotly.graph_objects as go
+    from plotly.subplots import make_subplots
+
+    trace_cap = MINMAX_TARGET_POINTS if lttb_points else None
+
+    if view_mode == "Overlay (ซ้อนกัน)":
+        fig_main = go.Figure()
+        use_raster = (
+            HAS_DATASHADER
+            and lttb_points is None
+            and chart_type in RASTER_CHART_LAYERS
+            and len(plot_df) * len(cols) > RASTER_POINT_THRESHOLD
+        )
+        if use_raster:
+            add_raster_background(fig_main, plot_df, list(cols), chart_type)
+            # Trace โปร่งใส (ลดจุดแล้ว) ไว้สำหรับ hover + Trace ว่างที่มีสีเส้นไว้แสดงใน legend
+            # (legendgroup เดียวกัน: คลิก legend แล้วซ่อน/แสดง hover ของคอลัมน์นั้นไปด้วย)
+            series = get_plot_series(plot_key, plot_df, tuple(sorted(cols)), LTTB_TARGET_POINTS)
+            traces = []
+            for i, col in enumerate(cols):
+                color = trace_color(i)
+                traces.append(dict(
+                    type='scattergl', x=series[col][0], y=series[col][1], mode='markers',
+                    marker=dict(size=4, opacity=0, color=color), name=col, legendgroup=col,
+                    showlegend=False, hovertemplate='%{y:.2f} A'
+                ))
+                traces.append(dict(
+                    type='scattergl', x=[None], y=[None], mode='lines',
+                    line=dict(color=color, width=3), name=col, legendgroup=col, hoverinfo='skip'
+                ))
+            fig_main.add_traces(traces)
+        else:
+            series = get_plot_series(plot_key, plot_df, tuple(sorted(cols)), lttb_points)
+            fig_main.add_traces([
+                create_trace(*series[col], col, chart_type, max_points=trace_cap)
+                for col in cols
+            ])
+
+        # rangeslider วาดทุก Trace ซ้ำอีกรอบ: แสดงเฉพาะเมื่อจำนวนจุดที่ส่งจริงไม่มาก
+        # (โหมด raster ไม่แสดง เพราะภาพพื้นหลังไม่ถูกวาดใน rangeslider)
+        max_trace_points = max((len(trace.y) for trace in fig_main.data), default=0)
+        show_rangeslider = not use_raster and max_trace_points < RANGESLIDER_MAX_POINTS
+
+        fig_main.update_layout(
+            height=450,
+            **hover_layout(plot_df),
+            xaxis_title="Time",
+            yaxis_title="Current (Ampere)",
+            xaxis=dict(
+                rangeslider=dict(visible=show_rangeslider), 
+                type="date",
+                **x_axis_format
+            ),
+            barmode='group' if chart_type == "Bar (แท่ง)" else None
+        )
+
+    else: # Stacked Mode
+        series = get_plot_series(plot_key, plot_df, tuple(sorted(cols)), lttb_points)
+        num_vars = len(cols)
+        # จำกัดจำนวนจุดรวมทุก subplot (รวมถึง "1s (Special)") ไม่ให้ browser วาดไม่ไหว
+        stacked_cap = max(2, STACKED_POINT_BUDGET // num_vars)
+        trace_cap = min(trace_cap, stacked_cap) if trace_cap else stacked_cap
+        fig_main = make_subplots(
+            rows=num_vars, cols=1, 
+            shared_xaxes=True,
+            vertical_spacing=0.05,
+            subplot_titles=list(cols)
+        )
+
+        fig_main.add_traces(
+            [create_trace(*series[col], col, chart_type, max_points=trace_cap) for col in cols],
+            rows=list(range(1, num_vars + 1)), cols=[1] * num_vars
+        )
+
+        total_height = 250 * num_vars
+        fig_main.update_layout(
+            height=total_height,
+            **hover_layout(plot_df),
+            xaxis=dict(
+                rangeslider=dict(visible=False), 
+                type="date",
+                **x_axis_format
+            ),
+            showlegend=False
+        )
+
+    return fig_main
+
+# cache_resource: ใช้ Figure เดิมซ้ำเมื่อ input ไม่เปลี่ยน (เฉพาะกราฟที่ลดจุดแล้ว)
+# lttb_points=None (ความละเอียดเต็ม) ไม่ cache: Figure เก็บสำเนาทุกจุดของทุกเส้นไว้
+@st.cache_resource(max_entries=16)
+def cached_total_figure(plot_key, _plot_df, fixed_groups, x_axis_format, lttb_points):
+    return make_total_figure(plot_key, _plot_df, fixed_groups, x_axis_format, lttb_points)
+
+@st.cache_resource(max_entries=16)
+def cached_main_figure(plot_key, _plot_df, cols, view_mode, chart_type, x_axis_format, lttb_points):
+    return make_main_figure(plot_key, _plot_df, cols, view_mode, chart_type, x_axis_format, lttb_points)
+
+def build_total_figure(plot_key, plot_df, fixed_groups, x_axis_format, lttb_points):
+    if lttb_points is None:
+        return make_total_figure(plot_key, plot_df, fixed_groups, x_axis_format, lttb_points)
+    return cached_total_figure(plot_key, plot_df, fixed_groups, x_axis_format, lttb_points)
+
+def build_main_figure(plot_key, plot_df, cols, view_mode, chart_type, x_axis_format, lttb_points):
+    if lttb_points is None:
+        return make_main_figure(plot_key, plot_df, cols, view_mode, chart_type, x_axis_format, lttb_points)
+    return cached_main_figure(plot_key, plot_df, cols, view_mode, chart_type, x_axis_format, lttb_points)
 
 # ---------------------------------------------------------
 # 3. ส่วนอัพโหลดและ Sidebar
@@ -174,29 +759,13 @@ with st.sidebar:
 
     
     if uploaded_files:
-        df = load_and_combine_data(uploaded_files)
+        data = load_and_combine_data(uploaded_files)
+        df = data.df if data is not None else None
         
         if df is not None and not df.empty:
-            # --- กำหนดกลุ่มคอลัมน์คงที่ (Fixed Total Columns) ---
-            all_numeric_cols = df.select_dtypes(include=['float', 'int']).columns.tolist()
-            
-            # Original Fixed Total Columns (Total REC, Total Left/Bottom/Right)
-            original_fixed_cols = [col for col in all_numeric_cols if 'Total' in col and 'Bare Anode' not in col] 
-            
-            # New Fixed Bare Anode Columns (ที่เพิ่งคำนวณเพิ่ม)
-            new_fixed_cols = [
-                'Bare Anode B7 (REC.1)', 
-                'Total Left Bare Anode (L6+B4)', 
-                'Total Right Bare Anode (R6+R8)', 
-                'Total Bottom Bare Anode (B2+B3+L8+L10+L12)', 
-                'Overall Bare Anode'
-            ]
-            
-            # รวมคอลัมน์ Fixed ทั้งหมด
-            FIXED_TOTAL_COLS = [col for col in original_fixed_cols + new_fixed_cols if col in all_numeric_cols]
-            
-            # คอลัมน์ที่ผู้ใช้เลือกได้ (คือทุกคอลัมน์ที่ไม่ใช่คอลัมน์ Total/Bare Anode Total)
-            selectable_cols = [col for col in all_numeric_cols if col not in FIXED_TOTAL_COLS and col not in ['DATE', 'TIME', 'Enable Alarm Rec.1', 'Enable Alarm Rec.2']]
+            FIXED_TOTAL_COLS = data.fixed_total_cols
+            selectable_cols = data.selectable_cols
+            new_fixed_cols = data.new_fixed_cols
             
             # --- Sidebar Settings ---
             st.header("⚙️ Chart Settings")
@@ -319,19 +888,20 @@ with st.sidebar:
 # ---------------------------------------------------------
 if uploaded_files and df is not None and not df.empty:
 
-    mask = (df.index >= start_date) & (df.index <= end_date)
-    filtered_raw_df = df.loc[mask]
+    # รวมคอลัมน์ที่จะใช้พลอตทั้งหมด
+    all_plotting_cols = list(set(selected_non_total_cols + FIXED_TOTAL_COLS))
+
+    plot_cols = tuple(sorted(all_plotting_cols))
+    plot_df, auc_df = compute_plot_frame(data, start_date, end_date, selected_resample_rule, plot_cols)
+    # key ของ plot_df สำหรับ cache กราฟ (ไม่ต้อง hash ข้อมูลทั้งก้อน)
+    plot_key = (data.digest, start_date, end_date, selected_resample_rule, plot_cols)
 
-    if filtered_raw_df.empty:
+    if plot_df is None:
         st.warning("⚠️ ไม่พบข้อมูลในช่วงเวลาที่เลือก")
         st.stop()
-    
-    # รวมคอลัมน์ที่จะใช้พลอตทั้งหมด
-    all_plotting_cols = list(set(selected_non_total_cols + FIXED_TOTAL_COLS))
 
-    plot_df = filtered_raw_df[all_plotting_cols]
-    if selected_resample_rule:
-        plot_df = plot_df.resample(selected_resample_rule).mean()
+    # ลดจำนวนจุดด้วย LTTB ยกเว้นเมื่อเลือก "1s (Special)" ที่ต้องการความละเอียดเต็ม
+    lttb_points = None if selected_interval_label == "1s (Special)" else LTTB_TARGET_POINTS
 
     # ---------------------------------------------------------
     # 5. Summary & Plotting (จัดเรียงใหม่ตามคำขอ)
@@ -363,22 +933,8 @@ if uploaded_files and df is not None and not df.empty:
         other_total_cols = [col for col in FIXED_TOTAL_COLS if col not in total_rec_cols and col not in bare_anode_cols]
         sorted_fixed_cols = total_rec_cols + bare_anode_cols + other_total_cols
         
-        summary_data = []
-        for col in sorted_fixed_cols:
-            coulombs, amp_hours, avg_current = calculate_auc(filtered_raw_df, col) # เพิ่ม avg_current
-            min_val = filtered_raw_df[col].min()
-            max_val = filtered_raw_df[col].max()
-            
-            summary_data.append({
-                'Parameter': col,
-                'Total Charge (Ah)': f"{amp_hours:,.2f}",
-                'Total Charge (C)': f"{coulombs:,.0f}",
-                'Avg Current (A)': f"{avg_current:,.2f}", # เพิ่ม Avg Current
-                'Min Current (A)': f"{min_val:,.0f}",
-                'Max Current (A)': f"{max_val:,.0f}"
-            })
-
-        summary_df = pd.DataFrame(summary_data).set_index('Parameter')
+        # จัดรูปแบบตัวเลขทั้งตารางครั้งเดียวด้วย Styler
+        summary_df = auc_df.loc[sorted_fixed_cols].style.format(SUMMARY_FORMATS)
         
         st.dataframe(summary_df, width='stretch')
         st.divider()
@@ -414,52 +970,8 @@ if uploaded_files and df is not None and not df.empty:
         if group4_cols: fixed_groups.append((group4_title, group4_cols))
         if group5_cols: fixed_groups.append((group5_title, group5_cols))
 
-        # --- 2. สร้าง Subplots ---
-        num_total_groups = len(fixed_groups)
-        subplot_titles = [title for title, _ in fixed_groups]
-
-        fig_total = make_subplots(
-            rows=num_total_groups, cols=1, 
-            shared_xaxes=True, 
-            vertical_spacing=0.05,
-            subplot_titles=subplot_titles
-        )
-
-        # --- 3. เพิ่ม Trace ในแต่ละกลุ่ม (Always Overlay) ---
-        for i, (group_title, group_cols) in enumerate(fixed_groups):
-            row_index = i + 1
-            
-            for col in group_cols:
-                total_chart_type = "Line (เส้นปกติ)" 
-                trace = create_trace(plot_df.index, plot_df[col], col, total_chart_type, fixed_size=None) 
-                fig_total.add_trace(trace, row=row_index, col=1)
-            
-            fig_total.update_yaxes(title_text="Current (Ampere)", row=row_index, col=1)
-        
-        # --- 4. การตั้งค่า Layout และแกน X ---
-
-        fig_total.update_xaxes(
-            showticklabels=True,  
-            ticks='outside',
-            tickangle=45,          
-            **x_axis_format,       
-            row = list(range(1, num_total_groups + 1)), 
-            col = 1
-        )
-        
-        total_height_fixed = 300 * num_total_groups 
-        
-        fig_total.update_layout(
-            height=total_height_fixed,
-            hovermode="x unified", 
-            xaxis=dict(
-                rangeslider=dict(visible=False), 
-                type="date",
-                **x_axis_format
-            ),
-            showlegend=True, 
-            title=""
-        )
+        # --- 2-4. สร้างกราฟ (cache ไว้ เปลี่ยน widget อื่นจะไม่สร้างใหม่) ---
+        fig_total = build_total_figure(plot_key, plot_df, fixed_groups, x_axis_format, lttb_points)
         
         st.plotly_chart(fig_total, width='stretch')
     else:
@@ -475,38 +987,33 @@ if uploaded_files and df is not None and not df.empty:
     if selected_non_total_cols: 
         st.subheader("Module Summary")
         
-        # ปรับการแสดงผล Metric ให้เป็น Columns
-        num_cols = len(selected_non_total_cols)
-        summary_col_blocks = st.columns(num_cols)
+        module_auc_df = auc_df.loc[selected_non_total_cols]
         
-        for idx, col in enumerate(selected_non_total_cols):
-            coulombs, amp_hours, avg_current = calculate_auc(filtered_raw_df, col)
-            min_val = filtered_raw_df[col].min()
-            max_val = filtered_raw_df[col].max()
-            
-            with summary_col_blocks[idx]:
-                st.markdown(f"**{col}**") 
-                st.metric(
-                    label=f"Total Charge (Ah)",
-                    value=f"{amp_hours:,.2f} Ah",
-                    delta=f"{coulombs:,.0f} C",
-                    delta_color="off"
-                )
-                st.metric(
-                    label=f"Average Current",
-                    value=f"{avg_current:,.2f} A", # เพิ่ม Avg
-                    delta_color="off"
-                )
-                st.metric(
-                    label=f"Minimum Current",
-                    value=f"{min_val:,.0f} A",
-                    delta_color="off"
-                )
-                st.metric(
-                    label=f"Maximum Current",
-                    value=f"{max_val:,.0f} A",
-                    delta_color="off"
-                )
+        # แสดงผล Metric เป็น HTML grid เดียว (ส่งไป frontend ครั้งเดียวแทน st.metric ทีละตัว)
+        cards = []
+        for col, amp_hours, coulombs, avg_current, min_val, max_val in module_auc_df.itertuples(name=None):
+            cards.append(f"""
+<div class="module-card">
+  <div class="module-name">{html.escape(col)}</div>
+  <div class="module-label">Total Charge (Ah)</div>
+  <div class="module-value">{amp_hours:,.2f} Ah</div>
+  <div class="module-delta">{coulombs:,.0f} C</div>
+  <div class="module-label">Average Current</div>
+  <div class="module-value">{avg_current:,.2f} A</div>
+  <div class="module-label">Minimum Current</div>
+  <div class="module-value">{min_val:,.0f} A</div>
+  <div class="module-label">Maximum Current</div>
+  <div class="module-value">{max_val:,.0f} A</div>
+</div>""")
+        
+        num_cols = len(selected_non_total_cols)
+        st.markdown(
+            MODULE_SUMMARY_CSS
+            + f'<div class="module-grid" style="grid-template-columns: repeat({num_cols}, minmax(0, 1fr));">'
+            + "".join(cards)
+            + "</div>",
+            unsafe_allow_html=True
+        )
     else:
         st.info("👈 ไม่ได้เลือก Modules ย่อย")
     
@@ -525,52 +1032,7 @@ if uploaded_files and df is not None and not df.empty:
         with col_h1_2:
             col_h1_2.subheader(f"📈 Trend Analysis (Modules) - {view_mode}")
         
-        if view_mode == "Overlay (ซ้อนกัน)":
-            fig_main = go.Figure()
-            for col in selected_non_total_cols:
-                trace = create_trace(plot_df.index, plot_df[col], col, selected_chart_type)
-                fig_main.add_trace(trace)
-            
-            fig_main.update_layout(
-                height=450,
-                hovermode="x unified",
-                xaxis_title="Time",
-                yaxis_title="Current (Ampere)",
-                xaxis=dict(
-                    rangeslider=dict(visible=True), 
-                    type="date",
-                    **x_axis_format
-                ),
-                barmode='group' if selected_chart_type == "Bar (แท่ง)" else None
-            )
-
-            st.plotly_chart(fig_main, width='stretch')
-
-        else: # Stacked Mode
-            num_vars = len(selected_non_total_cols)
-            fig_main = make_subplots(
-                rows=num_vars, cols=1, 
-                shared_xaxes=True,
-                vertical_spacing=0.05,
-                subplot_titles=selected_non_total_cols
-            )
-
-            for i, col in enumerate(selected_non_total_cols):
-                trace = create_trace(plot_df.index, plot_df[col], col, selected_chart_type)
-                fig_main.add_trace(trace, row=i+1, col=1)
-
-            total_height = 250 * num_vars
-            fig_main.update_layout(
-                height=total_height,
-                hovermode="x unified",
-                xaxis=dict(
-                    rangeslider=dict(visible=False), 
-                    type="date",
-                    **x_axis_format
-                ),
-                showlegend=False
-            )
-            
-            st.plotly_chart(fig_main, width='stretch')
+        fig_main = build_main_figure(plot_key, plot_df, tuple(selected_non_total_cols), view_mode, selected_chart_type, x_axis_format, lttb_points)
+        st.plotly_chart(fig_main, width='stretch')
     
     st.divider()
\ No newline at end of file
@@ -0,0 +1,241 @@
+# ---------------------------------------------------------
+# Numeric kernels สำหรับ AUC / Min-Max / LTTB
+# ใช้ Numba ถ้าติดตั้งไว้ (เร็วมากในโหมด "1s (Special)" ที่ไม่ resample)
+# ถ้า import numba ไม่ได้ จะ fallback เป็น NumPy ให้อัตโนมัติ
+#
+# รูปแบบข้อมูลที่รับ:
+#   y : float32[:, ::1]  (N แถว x C คอลัมน์, C-contiguous)
+#   x : float64[::1]     (N จุด, เช่น วินาทีนับจากจุดแรก)
+# ---------------------------------------------------------
+import numpy as np
+
+try:
+    from numba import njit, prange
+    HAS_NUMBA = True
+except ImportError:
+    HAS_NUMBA = False
+
+# --- Support NumPy 2.0+ (เลือกครั้งเดียวตอน import) ---
+_TRAPZ = np.trapezoid if hasattr(np, 'trapezoid') else np.trapz
+
+
+def _lttb_edges(n, n_out):
+    # แบ่งจุดตรงกลาง (1 .. n-2) เป็น n_out-2 buckets
+    return np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+
+
+# ---------------------------------------------------------
+# NumPy fallback
+# ---------------------------------------------------------
+def _trapezoid_cols_np(y, x):
+    return _TRAPZ(y, x, axis=0)
+
+
+def _trapezoid_uniform_cols_np(y, dt):
+    # ระยะห่างคงที่: dt * (ผลรวมทั้งหมด - ครึ่งหนึ่งของจุดแรกและจุดสุดท้าย)
+    if len(y) < 2:
+        return np.zeros(y.shape[1])
+    total = y.sum(axis=0, dtype=np.float64)
+    ends = 0.5 * (y[0].astype(np.float64) + y[-1].astype(np.float64))
+    return dt * (total - ends)
+
+
+def _minmax_cols_np(y):
+    # fmin/fmax ข้าม NaN (เหมือน np.nanmin/np.nanmax แต่ไม่มี warning)
+    if len(y) == 0:
+        return np.full(y.shape[1], np.nan), np.full(y.shape[1], np.nan)
+    return (np.fmin.reduce(y, axis=0).astype(np.float64),
+            np.fmax.reduce(y, axis=0).astype(np.float64))
+
+
+def _lttb_1d_np(xf, y, n_out):
+    """LTTB แบบ vectorized (คืนค่า index ของจุดที่เลือก)
+
+    ใช้ค่าเฉลี่ยของ bucket ก่อนหน้า/ถัดไปเป็นจุดยึด (แทนจุดที่เลือกไว้แล้ว)
+    เพื่อให้คำนวณทุก bucket พร้อมกันได้โดยไม่ต้องวนลูปทีละจุด
+    """
+    n = len(y)
+    yf = y.astype(np.float64)
+
+    edges = _lttb_edges(n, n_out)
+    starts = edges[:-1]
+    counts = np.diff(edges)
+    bucket_id = np.repeat(np.arange(len(starts)), counts)
+
+    # ค่าเฉลี่ยของแต่ละ bucket (ข้าม NaN ที่เกิดจากช่องว่างหลัง resample)
+    valid = ~np.isnan(yf)
+    y_filled = np.where(valid, yf, 0.0)
+    valid_counts = np.add.reduceat(valid[1:n - 1].astype(np.int64), starts - 1)
+    mean_x = np.add.reduceat(xf[1:n - 1], starts - 1) / counts
+    mean_y = np.add.reduceat(y_filled[1:n - 1], starts - 1) / np.maximum(valid_counts, 1)
+
+    # จุดยึดซ้าย (a) และขวา (c) ของแต่ละ bucket
+    ax = np.concatenate(([xf[0]], mean_x[:-1]))[bucket_id]
+    ay = np.concatenate(([y_filled[0]], mean_y[:-1]))[bucket_id]
+    cx = np.concatenate((mean_x[1:], [xf[-1]]))[bucket_id]
+    cy = np.concatenate((mean_y[1:], [y_filled[-1]]))[bucket_id]
+
+    px = xf[1:n - 1]
+    py = yf[1:n - 1]
+    area = np.abs((ax - cx) * (py - ay) - (ax - px) * (cy - ay))
+    area = np.nan_to_num(area, nan=-1.0)
+
+    # argmax ต่อ bucket: หาตำแหน่งแรกที่พื้นที่เท่ากับค่าสูงสุดของ bucket นั้น
+    bucket_max = np.maximum.reduceat(area, starts - 1)
+    candidates = np.flatnonzero(area == bucket_max[bucket_id])
+    _, first = np.unique(bucket_id[candidates], return_index=True)
+    picked = candidates[first] + 1
+
+    return np.concatenate(([0], picked, [n - 1]))
+
+
+def _lttb_cols_np(x, y, n_out):
+    return np.stack([_lttb_1d_np(x, y[:, j], n_out) for j in range(y.shape[1])])
+
+
+# ---------------------------------------------------------
+# Numba kernels
+# ---------------------------------------------------------
+if HAS_NUMBA:
+
+    # reassoc/contract เปิด SIMD ได้ แต่ยังคงพฤติกรรม NaN เหมือน np.trapezoid
+    @njit(parallel=True, fastmath={'reassoc', 'contract'}, cache=True)
+    def _trapezoid_cols_nb(y, x):
+        n, c = y.shape
+        out = np.zeros(c)
+        for j in prange(c):
+            s = 0.0  # สะสมเป็น float64 กันความคลาดเคลื่อนจาก float32
+            for i in range(1, n):
+                s += (x[i] - x[i - 1]) * (np.float64(y[i, j]) + np.float64(y[i - 1, j]))
+            out[j] = 0.5 * s
+        return out
+
+    @njit(parallel=True, fastmath={'reassoc', 'contract'}, cache=True)
+    def _trapezoid_uniform_cols_nb(y, dt):
+        # อ่านข้อมูลรอบเดียว: dt * (ผลรวมจุดกลาง + ครึ่งหนึ่งของจุดแรกและจุดสุดท้าย)
+        n, c = y.shape
+        out = np.zeros(c)
+        if n < 2:
+            return out
+        for j in prange(c):
+            s = 0.0
+            for i in range(1, n - 1):
+                s += np.float64(y[i, j])
+            out[j] = dt * (s + 0.5 * (np.float64(y[0, j]) + np.float64(y[n - 1, j])))
+        return out
+
+    @njit(parallel=True, cache=True)
+    def _minmax_cols_nb(y):
+        n, c = y.shape
+        mins = np.full(c, np.nan)
+        maxs = np.full(c, np.nan)
+        for j in prange(c):
+            lo = np.inf
+            hi = -np.inf
+            seen = False
+            for i in range(n):
+                v = y[i, j]
+                if v == v:  # ข้าม NaN (เหมือน np.nanmin/np.nanmax)
+                    seen = True
+                    if v < lo:
+                        lo = v
+                    if v > hi:
+                        hi = v
+            if seen:
+                mins[j] = lo
+                maxs[j] = hi
+        return mins, maxs
+
+    _lttb_edges_nb = njit(cache=True)(_lttb_edges)
+
+    @njit(parallel=True, cache=True)
+    def _lttb_cols_nb(x, y, n_out):
+        # LTTB แบบดั้งเดิม: จุดยึดซ้ายคือจุดที่เลือกไว้ใน bucket ก่อนหน้า
+        n, c = y.shape
+        edges = _lttb_edges_nb(n, n_out)
+        n_buckets = n_out - 2
+        out = np.empty((c, n_out), dtype=np.int64)
+        for j in prange(c):
+            out[j, 0] = 0
+            out[j, n_out - 1] = n - 1
+            a = 0
+            for b in range(n_buckets):
+                # จุดยึดขวา: ค่าเฉลี่ยของ bucket ถัดไป (bucket สุดท้ายใช้จุดสุดท้าย)
+                if b < n_buckets - 1:
+                    cx = 0.0
+                    cy = 0.0
+                    cnt = 0
+                    for i in range(edges[b + 1], edges[b + 2]):
+                        cx += x[i]
+                        v = y[i, j]
+                        if v == v:
+                            cy += v
+                            cnt += 1
+                    cx /= edges[b + 2] - edges[b + 1]
+                    cy /= max(cnt, 1)
+                else:
+                    cx = x[n - 1]
+                    cy = y[n - 1, j]
+                    if cy != cy:
+                        cy = 0.0
+
+                ax = x[a]
+                ay = y[a, j]
+                if ay != ay:
+                    ay = 0.0
+
+                pick = edges[b]
+                best = -1.0
+                for i in range(edges[b], edges[b + 1]):
+                    area = abs((ax - cx) * (y[i, j] - ay) - (ax - x[i]) * (cy - ay))
+                    if area > best:  # NaN ไม่ผ่านเงื่อนไขนี้
+                        best = area
+                        pick = i
+                out[j, b + 1] = pick
+                a = pick
+        return out
+
+
+def trapezoid_uniform_cols(y, dt):
+    """พื้นที่ใต้กราฟเมื่อทุกจุดห่างกัน dt วินาทีเท่ากัน -> float64[C]"""
+    if HAS_NUMBA:
+        return _trapezoid_uniform_cols_nb(y, float(dt))
+    return _trapezoid_uniform_cols_np(y, dt)
+
+
+def trapezoid_cols(y, x):
+    """พื้นที่ใต้กราฟ (trapezoid) ของทุกคอลัมน์ -> float64[C]"""
+    if HAS_NUMBA:
+        return _trapezoid_cols_nb(y, x)
+    return _trapezoid_cols_np(y, x)
+
+
+def minmax_cols(y):
+    """ค่า Min/Max ของทุกคอลัมน์ (ข้าม NaN) -> (float64[C], float64[C])"""
+    if HAS_NUMBA:
+        return _minmax_cols_nb(y)
+    return _minmax_cols_np(y)
+
+
+def lttb_cols(x, y, n_out):
+    """index ของจุดที่ LTTB เลือกในแต่ละคอลัมน์ -> int64[C, n_out]
+
+    ผู้เรียกต้องแน่ใจว่า 3 <= n_out < N
+    """
+    if HAS_NUMBA:
+        return _lttb_cols_nb(x, y, n_out)
+    return _lttb_cols_np(x, y, n_out)
+
+
+def warmup():
+    # compile ล่วงหน้าด้วยข้อมูลจำลอง ให้การใช้งานครั้งแรกไม่ต้องรอ JIT
+    x = np.arange(16, dtype=np.float64)
+    y = np.ones((16, 2), dtype=np.float32)
+    trapezoid_cols(y, x)
+    trapezoid_uniform_cols(y, 1.0)
+    minmax_cols(y)
+    lttb_cols(x, y, 8)
+
+
+if HAS_NUMBA:
+    warmup()
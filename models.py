@@ -0,0 +1,19 @@
+# ---------------------------------------------------------
+# ชนิดข้อมูลที่ฟังก์ชัน cache ของ app.py คืนค่า
+# ต้องอยู่ในโมดูลที่ import ได้ (ไม่ใช่ใน app.py): Streamlit รัน app.py เป็น __main__ ใหม่
+# ทุกครั้งที่ rerun ทำให้ pickle คลาสที่ประกาศใน __main__ ไม่ได้ระหว่างที่ session อื่นกำลัง rerun
+# ---------------------------------------------------------
+from dataclasses import dataclass
+
+import pandas as pd
+
+
+@dataclass
+class LoadedData:
+    """ข้อมูลที่รวมแล้ว + กลุ่มคอลัมน์ที่คำนวณไว้ล่วงหน้า (cache ไปพร้อมกัน)"""
+    df: pd.DataFrame
+    numeric_cols: list
+    fixed_total_cols: list
+    selectable_cols: list
+    new_fixed_cols: list
+    digest: str  # hash ของเนื้อไฟล์ทั้งชุด ใช้เป็น key ของ cache ชั้นถัดไป